@@ -1,8 +1,91 @@
+import os
 import numpy as np
-from scipy.stats import gamma
+from concurrent.futures import ProcessPoolExecutor
+from scipy.linalg import cholesky, cho_solve, solve_triangular
 import matplotlib.pyplot as plt 
 from matplotlib.animation import FuncAnimation
 
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    # numba is optional, the kernels below then run as plain Python
+    HAVE_NUMBA = False
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+@njit
+def _mh_propose(q_last, Vold_chol, rand_normal):
+    """ 
+    Gaussian random walk proposal q_last + L z, 
+    where L is the Cholesky factor of the proposal covariance and z ~ N(0, I)
+    """
+    return q_last + Vold_chol @ rand_normal
+
+@njit
+def _in_limits(q_new, limits):
+    """ 
+    Check if every component of the proposal lies strictly within its limits
+    """
+    for i in range(q_new.shape[0]):
+        if not (limits[i, 0] < q_new[i] < limits[i, 1]):
+            return False
+    return True
+
+@njit
+def _mh_accept(SSqprev, SSqnew, std2, log_uniform, log_proposal_ratio=0.0):
+    """ 
+    Metropolis-Hastings test on the log of the acceptance probability. 
+    log_proposal_ratio is log q(old)/q(new) for a non symmetric proposal density q, 
+    it is zero for the random walk
+    """
+    return min(0.5 * (SSqprev - SSqnew) / std2 + log_proposal_ratio, 0.0) > log_uniform
+
+@njit
+def _std2_update(std2_prev, SSqprev, n0, rand_gamma):
+    """ 
+    Draw the noise variance from its inverse gamma conditional, 
+    given a standard gamma variate with shape 0.5*(n0+len(data))
+    """
+    bval = 0.5 * (n0 * std2_prev + SSqprev)
+    return bval / rand_gamma
+
+@njit
+def _welford_update(q, mean, M2, n):
+    """ 
+    Welford update of the running mean and the sum of outer products of deviations M2 
+    with q as the n-th sample, both modified in place
+    """
+    delta = q - mean
+    mean += delta / n
+    M2 += np.outer(delta, q - mean)
+
+@njit(fastmath=True)
+def _ssq(acc, data):
+    """ 
+    Sum of squares of acc - data, subtracting, squaring and summing in a single pass. 
+    The residuals stay in the precision of the inputs, the sum is accumulated in float64. 
+    fastmath lets LLVM reorder the sum into a vectorised FMA reduction. 
+    There is no bounds check, callers make sure acc and data have the same length
+    """
+    SSq = 0.0
+    for i in range(acc.shape[0]):
+        resid = acc[i] - data[i]
+        SSq += resid * resid
+    return SSq
+
+# MCMC object owned by a prefetching worker process, set once by _init_worker
+_worker_mcmc = None
+
+def _init_worker(mcmc):
+    global _worker_mcmc
+    _worker_mcmc = mcmc
+
+def _worker_SSqcalc(q_new):
+    return _worker_mcmc.SSqcalc(q_new)
+
 class MCMC:
     """
     Class for MCMC sampling
@@ -17,7 +100,12 @@ class MCMC:
         nsamples=100, 
         lstm_model={}, 
         adapt_interval=10, 
-        verbose=True
+        verbose=True,
+        prefetch_depth=1,
+        num_chains=1,
+        seed=None,
+        batch_proposal=False,
+        batch_size=10
     ):
 
         self.model          = model
@@ -27,47 +115,69 @@ class MCMC:
         self.nburn          = int(nsamples/2) # number of samples to discard during burn-in period
         self.verbose        = verbose
         self.adapt_interval = adapt_interval
+        self.prefetch_depth = prefetch_depth # number of steps evaluated speculatively in parallel
+        self.num_chains     = num_chains # number of independent chains run in parallel
+        self.rng            = np.random.default_rng(seed) # PCG64 generator for all random variates
+        self.batch_proposal = batch_proposal # propose and evaluate batch_size samples at once
+        self.batch_size     = batch_size
         self.data           = data
         self.lstm_model     = lstm_model
         self.n0             = 0.01
         self.qstart_limits  = np.array([[self.qpriors[1], self.qpriors[2]]])
         self.dc_true        = dc_true
+        self._data_row      = np.ascontiguousarray(np.ravel(data), dtype=float) # data as SSqcalc reads it
+        self._resid         = np.empty(self._data_row.shape) # residual buffer reused by SSqcalc
 
         return
 
     def evaluate_model(self):
 
         if self.lstm_model:
-            return self.model.reduced_order_model.evaluate(self.lstm_model)[1]
+            # The reduced order model repeats the acceleration in both of its columns, 
+            # keep one so the output has the layout of the full model's
+            return self.model.reduced_order_model_evaluate(self.lstm_model)[1][:, 0]
         else:
             return self.model.evaluate()[1]
             
-    def update_standard_deviation(self, SSqprev):
+    def update_standard_deviation(self, SSqprev, isample, rand_gamma):
         """ 
         Update standard deviation with every sample
         Accept/Reject criterion depends on the standard devation
+        rand_gamma is a standard gamma variate with shape 0.5*(n0+len(data))
         """
 
-        aval = 0.5*(self.n0+len(self.data))
-        bval = 0.5*(self.n0*self.std2[-1]+SSqprev)
-        self.std2.append(1/gamma.rvs(aval,scale=1/bval,size=1)[0])
+        self.std2[isample+1] = _std2_update(
+            self.std2[isample], SSqprev, self.n0, rand_gamma)
 
-    def update_covariance_matrix(self, qparams):
+    def update_covariance_matrix(self, M2, n):
         """ 
         Update covariance matrix after a certain number of samples regularly
         This is what makes it "Adaptive" Metropolis
+        M2 is the sum of outer products of deviations from the mean 
+        over the last n samples, accumulated by _welford_update
+        Returns the new covariance matrix and its Cholesky factor, 
+        which is what the proposals are drawn with
         """
 
-        Vnew = 2.38**2/len(self.qpriors.keys())*np.cov(qparams[:,-self.adapt_interval:])
-        if qparams.shape[0]==1:
-            Vnew = np.reshape(Vnew,(-1,1))
-        Vnew = np.linalg.cholesky(Vnew)
-        return Vnew.copy()
+        Vnew = 2.38**2/M2.shape[0]*M2/(n-1)
+        Vnew_chol = np.linalg.cholesky(Vnew)
+        return Vnew, Vnew_chol
+
+    def _check_output(self, acc):
+        """ 
+        The sum of squares kernels read the model output and the data element by element, 
+        so a model output of a different length would be silently truncated or overrun
+        """
+        if acc.size != self._data_row.size:
+            raise ValueError(
+                f"Model output has {acc.size} values but the data has {self._data_row.size}.")
 
     def compute_initial_covariance(self):
         """ 
         Compute initial covariance matrix 
         Perturb the initial guess for Dc to compute this initial covariance
+        The sum of squares error at the initial guess is kept in SSqstart, 
+        so the chain does not have to evaluate the model there again
         """
 
         # Initial Guess
@@ -76,6 +186,12 @@ class MCMC:
         # Evaluate the model on the initial guess                 
         acc_ = self.evaluate_model()
 
+        # Keep the data in the precision of the model output, e.g. float32 from the LSTM, 
+        # so the sum of squares does not stream twice the bytes through a float64 cast
+        if acc_.dtype != self._data_row.dtype and np.issubdtype(acc_.dtype, np.floating):
+            self._data_row = self._data_row.astype(acc_.dtype)
+            self._resid = np.empty(self._data_row.shape, dtype=acc_.dtype)
+
         # Perturb the dc value
         self.model.Dc *= (1 + 1e-6)
 
@@ -87,30 +203,44 @@ class MCMC:
         acc_dq = acc_dq_.reshape(1, -1)
 
         # Compute the variance of the noise
-        self.std2 = [np.sum((acc - self.data) ** 2, axis=1).item()/(acc.shape[1] - len(self.qpriors))]
-
-        # Compute the covariance matrix
-        X = ((acc_dq - acc) / (self.model.Dc * 1e-6)).T
-        X = np.linalg.inv(np.dot(X.T, X))
-        self.Vstart = self.std2[-1] * X 
-
-    def acceptreject(self, q_new, SSqprev, std2):
+        # One entry per sample plus the initial estimate, filled in by update_standard_deviation
+        # Taken like every later SSqnew, against the data in the model output precision
+        self.SSqstart = self._output_SSq(acc_)
+        self.std2 = np.empty(self.nsamples + 1)
+        self.std2[0] = self.SSqstart/(acc.shape[1] - len(self.qpriors))
+
+        # Compute the sensitivity of the model output to each parameter, one row per parameter
+        X = np.empty((1, acc.shape[1]))
+        np.subtract(acc_dq[0], acc[0], out=X[0])
+        X[0] /= self.qstart * 1e-6
+
+        # Compute the covariance matrix std2 (X X^T)^-1 from the Cholesky factor L of X X^T
+        XTX = X @ X.T
+        XTX_chol = cholesky(XTX, lower=True)
+        identity = np.eye(XTX.shape[0])
+        self.Vstart = self.std2[0] * cho_solve((XTX_chol, True), identity)
+
+        # Lower Cholesky factor of Vstart for drawing proposals, 
+        # the same kind of factor update_covariance_matrix returns once the chain adapts
+        self.Vstart_chol = cholesky(self.Vstart, lower=True)
+
+    def acceptreject(self, q_new, SSqprev, std2, log_uniform, SSqprefetch=None):
         """ 
         The acceptreject function checks if a proposed sample falls within the limits 
         and decides whether to accept or reject it 
         based on the acceptance probability and a random number. 
+        log_uniform is the log of a uniform random number drawn ahead of time. 
+        SSqprefetch is a future holding the sum of squares error of q_new 
+        when it has already been submitted by prefetch_SSq. 
         It returns a boolean value indicating acceptance 
         and the sum of squares error of the accepted or previous proposal.
 
-        The numpy function np.clip() is used to limit the values in an array. 
-        Here, it is being used to limit the acceptance probability calculated 
-        in the Adaptive Metropolis Algorithm.
+        The limit check and the acceptance test run in the compiled kernels 
+        _in_limits and _mh_accept, only the model evaluation in SSqcalc stays in Python.
 
-        In the provided Python code snippet, np.clip(0.5 * (SSqprev - SSqnew) / std2, -np.inf, 0) 
-        is used to ensure that the calculated acceptance probability value does not exceed 0 
-        and does not go below negative infinity. 
-        This is done by 'clipping' any calculated value below -np.inf to -np.inf, 
-        and any calculated value above 0 to 0.
+        In _mh_accept, min(0.5 * (SSqprev - SSqnew) / std2, 0) 
+        is used to ensure that the calculated acceptance probability value does not exceed 0, 
+        i.e. the acceptance probability itself does not exceed 1.
 
         The expression 0.5 * (SSqprev - SSqnew) / std2 is essentially the log 
         of the acceptance probability used in the Metropolis-Hastings Algorithm. 
@@ -124,55 +254,245 @@ class MCMC:
         std2 is a scaling factor.
         """
         # Check if the proposal values are within the limits
-        condition1 = (q_new > self.qstart_limits[:, 0])
-        condition2 = (q_new < self.qstart_limits[:, 1])
-        accept = np.all(condition1 & condition2, axis=0)
+        accept = _in_limits(q_new[:, 0], self.qstart_limits)
 
         if accept:
             # Compute the sum of squares error of the new proposal
-            SSqnew = self.SSqcalc(q_new)
-
-            # Compute the acceptance probability
-            accept_prob = np.clip(0.5 * (SSqprev - SSqnew) / std2, -np.inf, 0)
+            SSqnew = self.SSqcalc(q_new) if SSqprefetch is None else SSqprefetch.result()
 
             # Check if the proposal is accepted 
             # based on the acceptance probability and a random number
-            accept = accept_prob > np.log(np.random.rand(1))[0]
+            accept = _mh_accept(SSqprev, SSqnew, std2, log_uniform)
 
         return accept, SSqnew if accept else SSqprev
 
+    def evaluate_model_batch(self, dc_values):
+        """ 
+        Evaluate the model for several Dc values, one row of output per value, 
+        each row being what evaluate_model returns for that value. 
+        The LSTM reduced order model runs them as a single batch, 
+        the full model is solved once per value.
+        """
+
+        if self.lstm_model:
+            return self.model.reduced_order_model_evaluate_batch(self.lstm_model, dc_values)[1]
+
+        acc = np.empty((len(dc_values), self._data_row.size), dtype=self._data_row.dtype)
+        for i, dc in enumerate(dc_values):
+            self.model.Dc = float(dc)
+            acc[i] = self.evaluate_model().ravel()
+        return acc
+
     def SSqcalc(self, q_new):
         """ 
         The SSqcalc function updates the Dc parameter of the model with a proposed value, 
         evaluates the model's performance, and computes the sum of squares error 
-        between the model's accuracy and the data.
+        between the model's accuracy and the data, returned as a float.
         """
 
         # Update the Dc parameter of the model with the new proposal
-        self.model.Dc = q_new[0,]
+        # A plain float keeps the model's right hand side in scalar arithmetic
+        self.model.Dc = float(q_new[0, 0])
 
         # Evaluate the model's performance on the problem type and LSTM model
         acc = self.evaluate_model()
+
+        return self._output_SSq(acc)
+
+    def _output_SSq(self, acc):
+        """ 
+        Sum of squares error between a model output and the data, returned as a float
+        """
+
+        self._check_output(acc)
         
         # Compute the sum of squares error between the model's accuracy and the data
-        SSq = np.sum((acc.reshape(1, -1) - self.data)**2, axis=1, keepdims=True)
+        if HAVE_NUMBA:
+            # Fused compiled reduction, no temporaries
+            SSq = _ssq(np.ascontiguousarray(acc.ravel()), self._data_row)
+        else:
+            # The residual goes into a preallocated buffer and is squared and summed in one pass
+            np.subtract(acc.ravel(), self._data_row, out=self._resid)
+            SSq = np.einsum('i,i->', self._resid, self._resid).item()
 
         return SSq
 
+    def propose_batch(self, q_centre, Vold_chol, rand_normal):
+        """ 
+        Adaptive independent Metropolis-Hastings: 
+        propose len(rand_normal) samples at once from N(q_centre, Vold) 
+        and evaluate the model on all of them in one batched call. 
+        q_centre must not depend on the current state of the chain, 
+        it is the mean of the samples at the last covariance update.
+
+        Returns the proposals (one per row), their sums of squares errors 
+        (inf outside the limits, so they are always rejected) 
+        and the log of the proposal density at each of them, up to a constant.
+        """
+
+        q_batch = q_centre + rand_normal @ Vold_chol.T
+        inside = np.all(
+            (q_batch > self.qstart_limits[:, 0]) & (q_batch < self.qstart_limits[:, 1]), axis=1)
+
+        SSq_batch = np.full(q_batch.shape[0], np.inf)
+        if inside.any():
+            resid = self.evaluate_model_batch(q_batch[inside, 0]) - self._data_row
+            SSq_batch[inside] = np.einsum('ij,ij->i', resid, resid)
+
+        log_q_batch = -0.5 * np.einsum('ij,ij->i', rand_normal, rand_normal)
+
+        return q_batch, SSq_batch, log_q_batch
+
+    def _block_length(self, isample, max_length):
+        """ 
+        Number of steps from isample that share one proposal density: 
+        at most max_length, ending at the next covariance update or at the end of the chain
+        """
+        return min(max_length, self.adapt_interval - isample % self.adapt_interval, self.nsamples - isample)
+
+    def prefetch_SSq(self, pool, q_last, Vold_chol, rand_normal):
+        """ 
+        Prefetching Metropolis-Hastings: 
+        speculatively evaluate the proposals of the next len(rand_normal) steps 
+        along every possible accept/reject path, all at once on the pool.
+
+        Level j of the returned tree holds the 2**j possible proposals of step j. 
+        Rejecting or accepting node i of level j leads to node 2*i or 2*i+1 of level j+1. 
+        Each node is a future of the sum of squares error, 
+        or None if the proposal is outside the limits and need not be evaluated.
+        """
+
+        states = [q_last]
+        tree = []
+        for z in rand_normal:
+            proposals = [_mh_propose(q, Vold_chol, z) for q in states]
+            tree.append([
+                pool.submit(_worker_SSqcalc, np.reshape(q, (-1,1))) 
+                if _in_limits(q, self.qstart_limits) else None 
+                for q in proposals
+            ])
+            states = [q for pair in zip(states, proposals) for q in pair]
+
+        return tree
+
+    def _sample_scalar(self, qparams, accepted, Vold_chol, rand_normal, log_uniform, rand_gamma):
+        """ 
+        Chain for a single parameter such as Dc, 
+        where proposals, the limit check and the accept/reject bookkeeping 
+        reduce to arithmetic on Python floats instead of one element arrays. 
+        The acceptance test and the std2 draw are written out inline, 
+        a numba dispatch costs more than the arithmetic on scalars. 
+        Fills qparams, the acceptance log and std2 in place.
+        """
+
+        lower, upper = self.qstart_limits[0].tolist()
+        q_last = float(qparams[0, 0]) # Last sample of the chain
+        std_old = float(Vold_chol[0, 0]) # Standard deviation of the proposals
+        SSqprev = self.SSqstart # Squared error of previously sampled parameters
+        q_new_ = np.empty((1, 1)) # Proposal in the layout SSqcalc expects
+        std2 = self.std2
+        std2_prev = float(std2[0]) # Noise variance the current step is tested with
+        nwin, mean, M2 = 0, 0.0, 0.0 # Running variance of the samples since the last update
+
+        rand_normal = rand_normal[:, 0].tolist()
+        log_uniform = log_uniform.tolist()
+        rand_gamma = rand_gamma.tolist()
+
+        for isample in range(self.nsamples):
+            # Sample a new parameter from a normal distribution centred on the last sample
+            q_new = q_last + std_old * rand_normal[isample]
+
+            # Accept or reject the new sample based on the Metropolis-Hastings acceptance rule
+            accept = lower < q_new < upper
+            if accept:
+                q_new_[0, 0] = q_new
+                SSqnew = self.SSqcalc(q_new_)
+                accept = min(0.5 * (SSqprev - SSqnew) / std2_prev, 0.0) > log_uniform[isample]
+
+            # Print some diagnostic information
+            if self.verbose and isample % 100 == 0:
+                print(isample,accept)
+                print("Generated Sample ---- ", q_new)
+
+            accepted[isample] = accept
+            if accept:
+                q_last, SSqprev = q_new, SSqnew
+            qparams[0, isample+1] = q_last
+
+            # Welford update of the running variance
+            nwin += 1
+            delta = q_last - mean
+            mean += delta / nwin
+            M2 += delta * (q_last - mean)
+
+            # Update standard deviation, as in _std2_update
+            std2_prev = 0.5 * (self.n0 * std2_prev + SSqprev) / rand_gamma[isample]
+            std2[isample+1] = std2_prev
+
+            # Update the proposal standard deviation if it is time to adapt it
+            if (isample+1) % self.adapt_interval == 0:
+                try:
+                    _, Vold_chol = self.update_covariance_matrix(np.array([[M2]]), nwin)
+                    std_old = float(Vold_chol[0, 0])
+                except np.linalg.LinAlgError:
+                    # Window variance is zero, keep the previous one
+                    pass
+                nwin, mean, M2 = 0, 0.0, 0.0
+
     def sample(self, MAKE_ANIMATIONS):
         """ 
         The code provided seems to be part of a sampling algorithm 
         that uses the Metropolis-Hastings algorithm to generate samples from a distribution. 
         Markov Chain Monte Carlo (MCMC) method for parameter estimation.
+
+        With num_chains > 1, independent chains run in separate processes, 
+        each with its own generator spawned from self.rng, 
+        and the samples are returned as an array of shape 
+        (num_chains, number of parameters, number of samples after burn-in). 
+        Animations are only made for a single chain.
         """
 
         # Compute initial covariance
         self.compute_initial_covariance()
-        
-        qparams = np.copy(np.array([[self.qstart]])) # Array of sampled parameters
-        Vold = np.copy(self.Vstart) # Covariance matrix of previously sampled parameters
-        SSqprev = self.SSqcalc(qparams) # Squared error of previously sampled parameters
-        iaccept = 0 # Counter for accepted samples
+
+        if self.num_chains == 1:
+            qparams, self.std2 = self._sample_one(self.rng, MAKE_ANIMATIONS)
+            return qparams
+
+        rngs = self.rng.spawn(self.num_chains)
+        with ProcessPoolExecutor(max_workers=self.num_chains) as pool:
+            chains = list(pool.map(self._sample_one, rngs, [False]*self.num_chains))
+
+        self.std2 = np.stack([std2 for _, std2 in chains])
+        return np.stack([qparams for qparams, _ in chains])
+
+    def _sample_one(self, rng, MAKE_ANIMATIONS):
+        """ 
+        Run one chain from the initial guess, drawing its random variates from rng. 
+        Returns the samples and the standard deviation estimates after burn-in.
+        """
+
+        # Array of sampled parameters, preallocated for the whole chain
+        qstart = np.array([[self.qstart]], dtype=float)
+        qparams = np.empty((qstart.shape[0], self.nsamples + 1))
+        qparams[:, 0] = qstart[:, 0]
+        Vold = self.Vstart # Covariance matrix of previously sampled parameters, replaced not modified
+        Vold_chol = self.Vstart_chol # Lower Cholesky factor of Vold used to draw proposals
+        q_centre = qstart[:, 0].copy() # Centre of the independent batch proposals, moved at each update
+        SSqprev = self.SSqstart # Squared error of previously sampled parameters
+        accepted = np.zeros(self.nsamples, dtype=bool) # Acceptance log, summarised after the chain
+
+        # Running mean and covariance of the samples since the last covariance update
+        nwin = 0
+        mean = np.zeros(qparams.shape[0])
+        M2 = np.zeros((qparams.shape[0], qparams.shape[0]))
+
+        # Draw the random variates for the whole chain at once
+        rand_normal = rng.standard_normal((self.nsamples, Vold.shape[0]))
+        log_uniform = np.log(rng.random(self.nsamples))
+        rand_gamma = rng.standard_gamma(0.5*(self.n0+len(self.data)), size=self.nsamples)
+
+        block_end = 0 # First sample of the next prefetched or batch proposed block
 
         if MAKE_ANIMATIONS:
             # Animation setup
@@ -197,46 +517,108 @@ class MCMC:
 
             anim = FuncAnimation(fig, update, frames=self.nsamples, init_func=init, blit=True)
 
-        for isample in np.arange(self.nsamples):
-            # Sample new parameters from a normal distribution 
-            # with mean being the last element of qparams
-            q_new = np.reshape(np.random.multivariate_normal(qparams[:,-1],Vold),(-1,1)) 
-
-            # Accept or reject the new sample based on the Metropolis-Hastings acceptance rule
-            accept,SSqnew = self.acceptreject(q_new,SSqprev,self.std2[-1])
-
-            # Print some diagnostic information
-            print(isample,accept)
-            print("Generated Sample ---- ", q_new.item())
-            # print("Generated Sample ---- ",np.asscalar(q_new))
-
-            if accept:
-                # If the new sample is accepted, 
-                # add it to the list of sampled parameters
-                qparams = np.concatenate((qparams,q_new),axis=1)
-                SSqprev = SSqnew.copy()
-                iaccept += 1
+        # Pool for the speculative model evaluations, one worker per node of the tree,
+        # capped at the core count. Blocks never cross a covariance update, so depth beyond adapt_interval is unused
+        pool = None
+        prefetch_depth = min(self.prefetch_depth, self.adapt_interval)
+        if prefetch_depth > 1 and not self.batch_proposal:
+            pool = ProcessPoolExecutor(
+                max_workers=min(2**prefetch_depth - 1, os.cpu_count() or 1), 
+                initializer=_init_worker, initargs=(self,))
+
+        try:
+            if qparams.shape[0] == 1 and pool is None and not self.batch_proposal:
+                # Single parameter random walk without prefetching: run the scalar chain
+                self._sample_scalar(qparams, accepted, Vold_chol, rand_normal, log_uniform, rand_gamma)
             else:
-                # If the new sample is rejected, 
-                # add the previous sample to the list of sampled parameters
-                q_new = np.reshape(qparams[:,-1],(-1,1))
-                qparams = np.concatenate((qparams,q_new),axis=1)
-
-            self.update_standard_deviation(SSqprev)
-            # Update standard deviation
-
-            # Update the covariance matrix if it is time to adapt it
-            if (isample+1) % self.adapt_interval == 0:
-                try:
-                    Vold = self.update_covariance_matrix(qparams)
-                except:
-                    pass
+                for isample in np.arange(self.nsamples):
+                    cur_idx = isample + 1 # Column of qparams filled in this iteration
+
+                    if self.batch_proposal:
+                        if isample == block_end:
+                            # Propose and evaluate the block up to the next covariance update at once
+                            depth = self._block_length(isample, self.batch_size)
+                            q_batch, SSq_batch, log_q_batch = self.propose_batch(
+                                q_centre, Vold_chol, rand_normal[isample:isample+depth])
+                            block_start, block_end = isample, isample + depth
+                            # Log proposal density of the current sample, which the new proposal may have moved
+                            z_prev = solve_triangular(Vold_chol, qparams[:,isample] - q_centre, lower=True)
+                            log_q_prev = -0.5 * (z_prev @ z_prev)
+                        k = isample - block_start
+                        q_new = np.reshape(q_batch[k], (-1,1))
+                        SSqnew = float(SSq_batch[k])
+
+                        # Independent Metropolis-Hastings acceptance rule, 
+                        # corrected for the proposal density of the current and the new sample
+                        accept = _mh_accept(
+                            SSqprev, SSqnew, self.std2[isample], log_uniform[isample], 
+                            log_q_prev - log_q_batch[k])
+                        if accept:
+                            log_q_prev = log_q_batch[k]
+                    else:
+                        # Sample new parameters from a normal distribution 
+                        # with mean being the last element of qparams
+                        q_new = np.reshape(
+                            _mh_propose(qparams[:,isample], Vold_chol, rand_normal[isample]),
+                            (-1,1)) 
+
+                        SSqprefetch = None
+                        if pool is not None:
+                            if isample == block_end:
+                                # Prefetch up to the next covariance update, where the proposals change
+                                depth = self._block_length(isample, prefetch_depth)
+                                tree = self.prefetch_SSq(
+                                    pool, qparams[:,isample], Vold_chol, rand_normal[isample:isample+depth])
+                                block_start, block_end, node = isample, isample + depth, 0
+                            SSqprefetch = tree[isample - block_start][node]
+
+                        # Accept or reject the new sample based on the Metropolis-Hastings acceptance rule
+                        accept,SSqnew = self.acceptreject(
+                            q_new,SSqprev,self.std2[isample],log_uniform[isample],SSqprefetch)
+                        if pool is not None:
+                            node = 2*node + int(accept)
+
+                    # Print some diagnostic information
+                    if self.verbose and isample % 100 == 0:
+                        print(isample,accept)
+                        print("Generated Sample ---- ", q_new.ravel())
+
+                    accepted[isample] = accept
+                    if accept:
+                        # If the new sample is accepted, 
+                        # add it to the list of sampled parameters
+                        qparams[:, cur_idx] = q_new[:, 0]
+                        SSqprev = SSqnew
+                    else:
+                        # If the new sample is rejected, 
+                        # add the previous sample to the list of sampled parameters
+                        qparams[:, cur_idx] = qparams[:, isample]
+
+                    # Welford update of the running covariance
+                    nwin += 1
+                    _welford_update(qparams[:, cur_idx], mean, M2, nwin)
+
+                    self.update_standard_deviation(SSqprev, isample, rand_gamma[isample])
+                    # Update standard deviation
+
+                    # Update the covariance matrix if it is time to adapt it
+                    if (isample+1) % self.adapt_interval == 0:
+                        try:
+                            Vold, Vold_chol = self.update_covariance_matrix(M2, nwin)
+                            q_centre = mean.copy()
+                        except np.linalg.LinAlgError:
+                            # Window covariance is not positive definite, keep the previous one
+                            pass
+                        nwin = 0
+                        mean[:] = 0.0
+                        M2[:] = 0.0
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
 
         # Print acceptance ratio
-        print("acceptance ratio:",iaccept/self.nsamples)
-
-       # Trim the estimate of the standard deviation to exclude burn-in samples  
-        self.std2 = np.asarray(self.std2)[self.nburn:] 
+        if self.verbose:
+            print("acceptance ratio:",accepted.mean())
 
         if MAKE_ANIMATIONS:
             # Save the animation with the extracted dc_value in the filename
@@ -246,5 +628,6 @@ class MCMC:
             # Close the figure to free up memory
             plt.close(fig)
 
-        # Return accepted samples
-        return qparams[:,self.nburn:]
+        # Return accepted samples 
+        # and the estimate of the standard deviation, both excluding burn-in samples
+        return qparams[:,self.nburn:], self.std2[self.nburn:]
@@ -163,9 +163,10 @@ class RSF(RSF_base):
       # Calculate and plot KDE
       kde_x_values = np.linspace(*axes[0].get_ylim(), KDE_POINTS)
       kde = gaussian_kde(qparams[0, :])
-      axes[1].plot(kde.pdf(kde_x_values), kde_x_values, 'b-', linewidth=PLOT_LINE_WIDTH)
+      kde_pdf_values = kde.pdf(kde_x_values) # evaluated once, used for the line and the fill
+      axes[1].plot(kde_pdf_values, kde_x_values, 'b-', linewidth=PLOT_LINE_WIDTH)
       axes[1].fill_betweenx(
-         kde_x_values, kde.pdf(kde_x_values), np.zeros(kde_x_values.shape), alpha=PLOT_ALPHA)
+         kde_x_values, kde_pdf_values, np.zeros(kde_x_values.shape), alpha=PLOT_ALPHA)
       axes[1].set_xlim(0, None)
       axes[1].set_xlabel('Prob. density')
       axes[1].get_yaxis().set_visible(False)
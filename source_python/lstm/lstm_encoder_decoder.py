@@ -237,12 +237,22 @@ class lstm_seq2seq(nn.Module):
         : return np_outputs:       np.array containing predicted values; prediction done recursively 
         '''
 
+        # a batch of one sequence
+        return self.predict_batch(input_tensor.unsqueeze(1), target_len)[:, 0, :]
+
+    def predict_batch(self, input_tensor, target_len):        
+        '''
+        : param input_tensor:      input data (seq_len, # in batch, input_size); PyTorch tensor 
+        : param target_len:        number of target values to predict 
+        : return np_outputs:       np.array (target_len, # in batch, input_size) containing predicted values 
+        :                          for every sequence in the batch; prediction done recursively 
+        '''
+
         # encode input_tensor
-        input_tensor = input_tensor.unsqueeze(1)     
         _, encoder_hidden = self.encoder(input_tensor)
 
         # initialize tensor for predictions
-        outputs = torch.zeros(target_len, input_tensor.shape[2])
+        outputs = torch.zeros(target_len, input_tensor.shape[1], input_tensor.shape[2])
 
         # decode input_tensor
         decoder_input = input_tensor[-1, :, :]
@@ -250,7 +260,7 @@ class lstm_seq2seq(nn.Module):
         
         for t in range(target_len):
             decoder_output, decoder_hidden = self.decoder(decoder_input, decoder_hidden)
-            outputs[t] = decoder_output.squeeze(0)
+            outputs[t] = decoder_output
             decoder_input = decoder_output
             
         np_outputs = outputs.detach().numpy()
@@ -9,37 +9,44 @@ class RateStateModel:
     """
 
     def reduced_order_model_evaluate(self,lstm_model):
+        """ 
+        Evaluate the reduced order model for the current dc value, as a batch of one. 
+        Returns the (time, dc) array and the acceleration repeated in both columns.
+        """
+
+        t_, acc_    = self.reduced_order_model_evaluate_batch(lstm_model, [self.Dc])
+        t           = np.column_stack((t_, np.full_like(t_, self.Dc)))
+        acc         = np.column_stack((acc_[0], acc_[0]))
+
+        # Return the time and acceleration arrays
+        return t, acc
+
+    def reduced_order_model_evaluate_batch(self, lstm_model, dc_values):
+        """ 
+        Evaluate the reduced order model for several dc values in one LSTM pass, 
+        with the dc values as the batch dimension. 
+        Returns the time array and the acceleration, one row per dc value. 
+        reduced_order_model_evaluate runs a batch of one through here.
+        """
 
-        def get_acc_for_current_step(step_number, window, t):
-            start                  = step_number * window
-            end                    = start + window
-            train_plt[0:window, 0] = t[start:end, 0]
-            train_plt[0:window, 1] = t[start:end, 1]
-            train_plt_torch        = torch.from_numpy(train_plt).type(torch.Tensor)
-            Y_train_pred           = lstm_model.predict(train_plt_torch, target_len=window)
-            acc[start:end, 0]      = Y_train_pred[:, 0]
-            acc[start:end, 1]      = Y_train_pred[:, 0]
-            return acc 
-                
         # Calculate the number of steps to take
         num_steps   = int(np.floor((self.t_final - self.t_start) / self.delta_t))
         window      = int(self.num_tsteps/20)
+        num_batch   = len(dc_values)
         # Create arrays to store trajectory
-        t           = np.zeros((num_steps, 2))
-        acc         = np.zeros((num_steps, 2))
-        t[0, 0]     = self.t_start
-        # Calculate the time array
-        k = 1
-        while k < num_steps:
-            t[k, 0] = t[k-1, 0] + self.delta_t
-            k += 1
-        t[:, 1]     = self.Dc
-        num_steps   = int(num_steps / window)
-        train_plt   = np.zeros((window, 2))
-
-        # Predict acceleration using the LSTM model
-        for step_number in range(num_steps):
-            acc     = get_acc_for_current_step(step_number, window, t)
+        t           = self.t_start + self.delta_t * np.arange(num_steps)
+        acc         = np.zeros((num_batch, num_steps), dtype=np.float32) # LSTM output precision
+        train_plt   = np.zeros((window, num_batch, 2))
+        train_plt[:, :, 1] = dc_values
+
+        # Predict acceleration using the LSTM model, every dc value at once
+        for step_number in range(int(num_steps / window)):
+            start                  = step_number * window
+            end                    = start + window
+            train_plt[:, :, 0]     = t[start:end, np.newaxis]
+            train_plt_torch        = torch.from_numpy(train_plt).type(torch.Tensor)
+            Y_train_pred           = lstm_model.predict_batch(train_plt_torch, target_len=window)
+            acc[:, start:end]      = Y_train_pred[:, :, 0].T
 
         # Return the time and acceleration arrays
         return t, acc
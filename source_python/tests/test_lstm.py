@@ -0,0 +1,43 @@
+import pytest
+import numpy as np
+
+torch = pytest.importorskip("torch")
+
+from ..MCMC import MCMC
+from ..lstm.lstm_encoder_decoder import lstm_seq2seq
+from ..lstm.utils import RateStateModel
+
+class SmallRateStateModel(RateStateModel):
+    """Reduced order model with 40 time steps, two per LSTM window"""
+    t_start = 0.0
+    t_final = 50.0
+    delta_t = 1.25
+    num_tsteps = 40
+    Dc = None
+
+class TestReducedOrderModel:
+    @pytest.fixture
+    def lstm_model(self):
+        torch.manual_seed(0)
+        return lstm_seq2seq(input_size=2, hidden_size=8, num_layers=1)
+
+    def test_batch_matches_single(self, lstm_model):
+        model = SmallRateStateModel()
+        dc_values = np.array([100.0, 1000.0, 5000.0])
+        t_batch, acc_batch = model.reduced_order_model_evaluate_batch(lstm_model, dc_values)
+        assert acc_batch.shape == (3, 40), "batch output should have one row per dc value"
+
+        for row, dc in zip(acc_batch, dc_values):
+            model.Dc = dc
+            t, acc = model.reduced_order_model_evaluate(lstm_model)
+            assert np.allclose(t_batch, t[:, 0]), "batch and single time arrays should agree"
+            assert np.allclose(row, acc[:, 0], atol=1e-5), "batch row should match the single evaluation"
+
+    def test_mcmc_evaluate_model_layout(self, lstm_model):
+        model = SmallRateStateModel()
+        mcmc = MCMC(model, np.zeros(40), 1000.0, [1.0, 0.0, 10000.0], 1000.0, lstm_model=lstm_model)
+        model.Dc = 1000.0
+        acc = mcmc.evaluate_model()
+        assert acc.shape == (40,), "reduced order model output should have the data layout"
+        assert np.allclose(mcmc.evaluate_model_batch(np.array([1000.0]))[0], acc, atol=1e-5), \
+            "batch and single entry points should agree"
@@ -1,12 +1,38 @@
 import pytest
 import numpy as np
-from ..MCMC import MCMC  # Adjust the import path as needed
+from scipy.stats import gamma
+from ..MCMC import MCMC, _std2_update, _welford_update  # Adjust the import path as needed
 
 class MockModel:
     def evaluate(self):
         # Mock implementation
         return np.random.rand(10), np.random.rand(10)
 
+class DecayModel:
+    """Deterministic stand-in for RateStateModel with Dc as its only parameter"""
+    Dc = None
+
+    def evaluate(self):
+        t = np.linspace(0.0, 1.0, 50)
+        acc = np.exp(-t * 100.0 / self.Dc)
+        return t, acc, acc
+
+class Float32DecayModel(DecayModel):
+    """DecayModel with float32 output, like the LSTM reduced order model"""
+
+    def evaluate(self):
+        t, acc, acc_noise = super().evaluate()
+        return t, acc.astype(np.float32), acc_noise.astype(np.float32)
+
+class LinearModel:
+    """Model linear in Dc, whose posterior is known in closed form"""
+    Dc = None
+    t = np.linspace(0.0, 1.0, 50)
+
+    def evaluate(self):
+        acc = self.Dc * self.t
+        return self.t, acc, acc
+
 class TestMCMC:
     @pytest.fixture
     def mock_model(self):
@@ -27,3 +53,96 @@ class TestMCMC:
         # Example test for the evaluate_model method
         result = mcmc_instance.evaluate_model()
         assert isinstance(result, np.ndarray), "evaluate_model should return a numpy array"
+
+    def test_output_length_mismatch(self, mcmc_instance):
+        # MockModel returns 10 values against 100 data points
+        with pytest.raises(ValueError):
+            mcmc_instance.compute_initial_covariance()
+        with pytest.raises(ValueError):
+            mcmc_instance.SSqcalc(np.array([[1000.0]]))
+
+    @pytest.fixture
+    def decay_instance(self):
+        model = DecayModel()
+        model.Dc = 500.0
+        data = model.evaluate()[2] + 0.01 * np.random.randn(50)
+        return MCMC(model, data, 500.0, [1.0, 0.0, 10000.0], 1000.0, nsamples=40)
+
+    def test_sample_shapes(self, decay_instance):
+        qparams = decay_instance.sample(False)
+        assert qparams.shape == (1, 21), "sample should return the chain after burn-in"
+        assert decay_instance.std2.shape == (21,), "std2 should be trimmed like the chain"
+        assert np.all(np.isfinite(qparams)), "samples should be finite"
+
+    def test_update_covariance_matrix(self, mcmc_instance):
+        qwindow = np.array([[1.0, 2.0, 4.0, 3.0, 5.0]])
+        mean, M2 = np.zeros(1), np.zeros((1, 1))
+        for n in range(1, qwindow.shape[1] + 1):
+            _welford_update(qwindow[:, n-1], mean, M2, n)
+        Vnew, Vnew_chol = mcmc_instance.update_covariance_matrix(M2, qwindow.shape[1])
+        assert np.allclose(Vnew, 2.38**2 * np.var(qwindow, ddof=1)), "covariance should be scaled window variance"
+        assert np.allclose(Vnew_chol @ Vnew_chol.T, Vnew), "second output should be the Cholesky factor"
+
+    def test_prefetch_matches_sequential_chain(self, decay_instance):
+        decay_instance.rng = np.random.default_rng(0)
+        qparams = decay_instance.sample(False)
+        decay_instance.prefetch_depth = 3
+        decay_instance.rng = np.random.default_rng(0)
+        qparams_prefetch = decay_instance.sample(False)
+        assert np.array_equal(qparams, qparams_prefetch), "prefetching should not change the chain"
+
+    def test_sample_multiple_chains(self, decay_instance):
+        decay_instance.num_chains = 3
+        qparams = decay_instance.sample(False)
+        assert qparams.shape == (3, 1, 21), "chains should be stacked along the first axis"
+        assert decay_instance.std2.shape == (3, 21), "std2 should be stacked per chain"
+
+    def test_std2_update_matches_scipy_inverse_gamma(self):
+        n0, std2_prev, SSqprev, aval = 0.01, 0.5, 12.0, 25.005
+        bval = 0.5 * (n0 * std2_prev + SSqprev)
+        expected = 1 / gamma.rvs(aval, scale=1 / bval, size=4, random_state=np.random.default_rng(1))
+        rand_gamma = np.random.default_rng(1).standard_gamma(aval, size=4)
+        result = [_std2_update(std2_prev, SSqprev, n0, g) for g in rand_gamma]
+        assert np.allclose(result, expected), "std2 draw should match 1/Gamma(aval, scale=1/bval)"
+
+    def test_SSqcalc(self, decay_instance):
+        SSq = decay_instance.SSqcalc(np.array([[800.0]]))
+        acc = decay_instance.model.evaluate()[1]
+        assert isinstance(SSq, float), "SSqcalc should return a plain float"
+        assert np.isclose(SSq, np.sum((acc - decay_instance.data)**2)), "SSqcalc should match the plain sum of squares"
+
+    def test_compute_initial_covariance(self, decay_instance):
+        decay_instance.compute_initial_covariance()
+        Vstart_chol = decay_instance.Vstart_chol
+        assert np.all(np.linalg.eigvalsh(decay_instance.Vstart) > 0), "initial covariance should be positive definite"
+        assert np.allclose(Vstart_chol @ Vstart_chol.T, decay_instance.Vstart), "Vstart_chol should be a square root of Vstart"
+        assert np.allclose(Vstart_chol, np.tril(Vstart_chol)), "Vstart_chol should be the lower Cholesky factor"
+
+    def test_sample_batch_proposal(self):
+        # Linear model: with a flat prior the posterior of Dc is close to N(mu, s2 / t.t)
+        model = LinearModel()
+        rng = np.random.default_rng(1)
+        data = model.t + 0.1 * rng.standard_normal(model.t.size)
+        tt = model.t @ model.t
+        mu = model.t @ data / tt
+        sd = np.sqrt(np.sum((data - mu * model.t) ** 2) / (model.t.size - 1) / tt)
+
+        chains = []
+        for batch_size in (1, 10):
+            mcmc = MCMC(model, data, 1.0, [1.0, 0.0, 10000.0], 1.2, nsamples=6000, 
+                        verbose=False, seed=0, batch_proposal=True, batch_size=batch_size)
+            chains.append(mcmc.sample(False))
+        assert np.allclose(chains[0], chains[1]), "independent proposals should not depend on the batch size"
+        assert abs(chains[1].mean() - mu) < 0.2 * sd, "batch chain mean should match the posterior"
+        assert abs(chains[1].std() / sd - 1.0) < 0.1, "batch chain spread should match the posterior"
+
+    def test_SSqcalc_float32_model(self, decay_instance):
+        SSq64 = decay_instance.SSqcalc(np.array([[800.0]]))
+        decay_instance.model = Float32DecayModel()
+        decay_instance.compute_initial_covariance()
+        assert decay_instance._data_row.dtype == np.float32, "data should follow the model output precision"
+        assert decay_instance.SSqstart == decay_instance.SSqcalc(np.array([[decay_instance.qstart]])), \
+            "SSqstart should be taken like every later sum of squares"
+        SSq32 = decay_instance.SSqcalc(np.array([[800.0]]))
+        assert isinstance(SSq32, float), "SSqcalc should still return a plain float"
+        assert np.isclose(SSq32, SSq64, rtol=1e-4), "float32 residuals should match the float64 sum of squares"